@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Migration script to add a composite (status, order_id) index on listings
+Covers the "For Sale listings of an order" lookups used by wantlist matching
+"""
+
+from sqlalchemy import text
+from app import create_app
+from models import db
+
+def add_listing_status_order_index():
+    """Add the composite status/order index to the Listing table"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text("""
+                    CREATE INDEX IF NOT EXISTS idx_listing_status_order
+                    ON listing (status, order_id);
+                """))
+            
+            print("✅ Successfully added Listing table index")
+            print("   - idx_listing_status_order (status, order_id)")
+            
+        except Exception as e:
+            print(f"❌ Error adding index: {e}")
+            return False
+            
+    return True
+
+if __name__ == "__main__":
+    add_listing_status_order_index()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Migration script to add a trigram index on listing titles (PostgreSQL only)
+Lets wantlist reference matching prefilter candidate listings in the database
+"""
+
+from sqlalchemy import text
+from app import create_app
+from models import db
+
+def add_listing_title_trgm_index():
+    """Enable pg_trgm and add a GIN trigram index on listing.title"""
+    app = create_app()
+    
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("ℹ️ Skipping trigram index - only supported on PostgreSQL")
+            return True
+        
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+                conn.execute(text("""
+                    CREATE INDEX IF NOT EXISTS idx_listing_title_trgm
+                    ON listing USING gin (title gin_trgm_ops);
+                """))
+            
+            print("✅ Successfully added listing title trigram index")
+            print("   - pg_trgm extension")
+            print("   - idx_listing_title_trgm (title gin_trgm_ops)")
+            
+        except Exception as e:
+            print(f"❌ Error adding trigram index: {e}")
+            return False
+            
+    return True
+
+if __name__ == "__main__":
+    add_listing_title_trgm_index()
@@ -20,6 +20,7 @@ class Listing(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('discogs_id', 'order_id', name='unique_listing_per_order'),
+        db.Index('idx_listing_status_order', 'status', 'order_id'),
     )
     
     def to_dict(self):
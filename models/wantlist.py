@@ -1,3 +1,4 @@
+import orjson
 from datetime import datetime, timezone
 from . import db
 
@@ -26,13 +27,12 @@ class WantlistItem(db.Model):
     
     def to_dict(self):
         """Convert wantlist item to dictionary for API responses"""
-        import json
         return {
             'id': self.id,
             'discogs_want_id': self.discogs_want_id,
             'release_id': self.release_id,
             'title': self.title,
-            'artists': json.loads(self.artists) if self.artists else [],
+            'artists': orjson.loads(self.artists) if self.artists else [],
             'year': self.year,
             'format': self.format,
             'thumb_url': self.thumb_url,
@@ -44,9 +44,8 @@ class WantlistItem(db.Model):
     
     def update_from_discogs_data(self, discogs_data):
         """Update wantlist item from Discogs API data"""
-        import json
         self.title = discogs_data.get('title', self.title)
-        self.artists = json.dumps(discogs_data.get('artists', []))
+        self.artists = orjson.dumps(discogs_data.get('artists', [])).decode()
         self.year = discogs_data.get('year', self.year)
         self.format = discogs_data.get('format', self.format)
         self.thumb_url = discogs_data.get('thumb', self.thumb_url)
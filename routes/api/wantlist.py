@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify, current_app
-from services import auth_service, wantlist_service
+from services import auth_service, wantlist_service, background_job_service
 from models import db, User, WantlistItem, WantlistReference
 
 # Create wantlist API blueprint
@@ -15,14 +15,25 @@ def sync_wantlist():
         user = auth_service.get_current_user()
         force_refresh = request.json.get('force_refresh', False) if request.is_json else False
         
-        # Sync wantlist from Discogs
-        wantlist_items = wantlist_service.sync_user_wantlist(user.id, force_refresh)
+        # Serve what we already have; the Discogs sync runs in the background
+        wantlist_items = wantlist_service.get_user_wantlist(user.id)
+        
+        if not force_refresh and not wantlist_service.needs_sync(user.id):
+            return jsonify({
+                'success': True,
+                'message': f'Wantlist is up to date ({len(wantlist_items)} items)',
+                'items': wantlist_items,
+                'syncing': False
+            })
+        
+        started = background_job_service.enqueue_wantlist_sync(user.id, force_refresh)
         
         return jsonify({
             'success': True,
-            'message': f'Synced {len(wantlist_items)} wantlist items',
-            'items': wantlist_items
-        })
+            'message': 'Wantlist sync started' if started else 'Wantlist sync already in progress',
+            'items': wantlist_items,
+            'syncing': True
+        }), 202
         
     except Exception as e:
         current_app.logger.error(f"Error syncing wantlist: {e}")
@@ -4,10 +4,23 @@ Background job service for wantlist matching and seller inventory updates
 import schedule
 import time
 import threading
+import uuid
 from datetime import datetime, timedelta, timezone
 from flask import current_app
 from models import Order, User
 from services import wantlist_matching_service, discogs_service, wantlist_service
+from services.cache_service import cache_service
+
+WANTLIST_SYNC_LOCK_SECONDS = 600
+
+# Delete the lock only if it still holds our token, so a sync that outlived
+# its lock can't release one another worker has taken since
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
 class BackgroundJobService:
     """Service for managing background jobs"""
@@ -16,6 +29,8 @@ class BackgroundJobService:
         self.running = False
         self.job_thread = None
         self.last_run = {}
+        self._local_sync_locks = {}
+        self._local_sync_guard = threading.Lock()
     
     def start_scheduler(self):
         """Start the background job scheduler"""
@@ -99,6 +114,14 @@ class BackgroundJobService:
             
             refreshed_count = 0
             for user in users:
+                # Share the per-user lock with on-demand syncs so the two never
+                # write the same wants concurrently
+                lock_key = f"wl:sync:{user.id}"
+                lock_token = self._acquire_sync_lock(lock_key)
+                if lock_token is None:
+                    current_app.logger.info(f"⏭️ Wantlist sync already running for {user.username}, skipping")
+                    continue
+                
                 try:
                     # Sync wantlist to database (force refresh)
                     wantlist_items = wantlist_service.sync_user_wantlist(user.id, force_refresh=True)
@@ -109,12 +132,14 @@ class BackgroundJobService:
                     else:
                         current_app.logger.warning(f"❌ No wantlist items synced for {user.username}")
                     
-                    # Rate limiting - wait between users
-                    time.sleep(2)  # Increased delay to respect Discogs rate limits
-                    
                 except Exception as e:
                     current_app.logger.error(f"Error syncing wantlist for {user.username}: {e}")
                     continue
+                finally:
+                    self._release_sync_lock(lock_key, lock_token)
+                
+                # Rate limiting - wait between users
+                time.sleep(2)  # Increased delay to respect Discogs rate limits
             
             duration = datetime.now(timezone.utc) - start_time
             current_app.logger.info(f"🌙 Nightly wantlist refresh completed: {refreshed_count} users in {duration}")
@@ -123,6 +148,69 @@ class BackgroundJobService:
         except Exception as e:
             current_app.logger.error(f"Error in nightly wantlist refresh: {e}")
     
+    def enqueue_wantlist_sync(self, user_id, force_refresh=False):
+        """Start a wantlist sync for a user in a worker thread
+        
+        Returns True if this call started the sync, False if one was
+        already in progress for the user.
+        """
+        lock_key = f"wl:sync:{user_id}"
+        lock_token = self._acquire_sync_lock(lock_key)
+        if lock_token is None:
+            current_app.logger.info(f"Wantlist sync already running for user {user_id}")
+            return False
+        
+        app = current_app._get_current_object()
+        try:
+            threading.Thread(
+                target=self._run_wantlist_sync,
+                args=(app, lock_key, lock_token, user_id, force_refresh),
+                daemon=True
+            ).start()
+        except Exception:
+            self._release_sync_lock(lock_key, lock_token)
+            raise
+        return True
+    
+    def _run_wantlist_sync(self, app, lock_key, lock_token, user_id, force_refresh):
+        """Sync a user's wantlist inside its own app context, then release the lock"""
+        with app.app_context():
+            try:
+                wantlist_service.sync_user_wantlist(user_id, force_refresh=force_refresh)
+            except Exception as e:
+                current_app.logger.error(f"Error in background wantlist sync for user {user_id}: {e}")
+            finally:
+                self._release_sync_lock(lock_key, lock_token)
+    
+    def _acquire_sync_lock(self, lock_key):
+        """Take the per-user sync lock (Redis SET NX EX, in-process dict as fallback)
+        
+        Returns the token identifying this holder, or None if the lock is taken.
+        """
+        lock_token = uuid.uuid4().hex
+        if cache_service.is_available():
+            try:
+                acquired = cache_service.redis_client.set(lock_key, lock_token, nx=True, ex=WANTLIST_SYNC_LOCK_SECONDS)
+                return lock_token if acquired else None
+            except Exception as e:
+                current_app.logger.warning(f"Redis sync lock unavailable, using local lock: {e}")
+        with self._local_sync_guard:
+            if lock_key in self._local_sync_locks:
+                return None
+            self._local_sync_locks[lock_key] = lock_token
+            return lock_token
+    
+    def _release_sync_lock(self, lock_key, lock_token):
+        """Release the per-user sync lock if this holder still owns it"""
+        with self._local_sync_guard:
+            if self._local_sync_locks.get(lock_key) == lock_token:
+                del self._local_sync_locks[lock_key]
+        if cache_service.is_available():
+            try:
+                cache_service.redis_client.eval(_RELEASE_LOCK_LUA, 1, lock_key, lock_token)
+            except Exception as e:
+                current_app.logger.warning(f"Could not release sync lock {lock_key}: {e}")
+    
     def refresh_active_sellers(self):
         """Refresh active sellers every 6 hours"""
         try:
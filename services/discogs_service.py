@@ -261,47 +261,53 @@ class DiscogsService:
     def get_user_wantlist(self, user_id, discogs_username, access_token, access_token_secret):
         """Get user's wantlist from Discogs"""
         try:
-            oauth = self.get_oauth_session(access_token, access_token_secret)
-            
             wantlist = []
-            page = 1
-            per_page = 100
-            
-            while True:
-                response = oauth.get(
-                    f'https://api.discogs.com/users/{discogs_username}/wants',
-                    params={'page': page, 'per_page': per_page}
-                )
-                
-                if response.status_code != 200:
-                    break
-                    
-                data = response.json()
-                wants = data.get('wants', [])
-                
-                for want in wants:
-                    release = want.get('basic_information', {})
-                    wantlist.append({
-                        'id': want.get('id'),
-                        'release_id': release.get('id'),
-                        'title': release.get('title'),
-                        'artists': [artist.get('name') for artist in release.get('artists', [])],
-                        'year': release.get('year'),
-                        'format': ', '.join([fmt.get('name', '') for fmt in release.get('formats', [])]),
-                        'thumb': release.get('thumb', ''),
-                        'date_added': want.get('date_added')
-                    })
-                
-                if len(wants) < per_page:
-                    break
-                page += 1
-            
+            for page in self.iter_user_wantlist(discogs_username, access_token, access_token_secret):
+                wantlist.extend(page)
             return wantlist
             
         except Exception as e:
             current_app.logger.error(f"Erreur récupération wantlist: {e}")
             return []
     
+    def iter_user_wantlist(self, discogs_username, access_token, access_token_secret, per_page=100):
+        """Yield user's wantlist from Discogs one page (list of wants) at a time"""
+        oauth = self.get_oauth_session(access_token, access_token_secret)
+        page = 1
+        
+        while True:
+            response = oauth.get(
+                f'https://api.discogs.com/users/{discogs_username}/wants',
+                params={'page': page, 'per_page': per_page}
+            )
+            
+            if response.status_code != 200:
+                break
+                
+            data = response.json()
+            wants = data.get('wants', [])
+            
+            wantlist_page = []
+            for want in wants:
+                release = want.get('basic_information', {})
+                wantlist_page.append({
+                    'id': want.get('id'),
+                    'release_id': release.get('id'),
+                    'title': release.get('title'),
+                    'artists': [artist.get('name') for artist in release.get('artists', [])],
+                    'year': release.get('year'),
+                    'format': ', '.join([fmt.get('name', '') for fmt in release.get('formats', [])]),
+                    'thumb': release.get('thumb', ''),
+                    'date_added': want.get('date_added')
+                })
+            
+            if wantlist_page:
+                yield wantlist_page
+            
+            if len(wants) < per_page:
+                break
+            page += 1
+    
     @cache_result(expire_seconds=900)  # 15 minutes
     def fetch_seller_inventory(self, seller_name, access_token, access_token_secret):
         """Fetch seller's inventory from Discogs API with caching (full inventory)"""
@@ -340,7 +346,7 @@ class DiscogsService:
                     release = listing.get('release', {})
                     inventory.append({
                         'id': str(listing.get('id')),
-                        'release_id': str(release.get('id')) if release.get('id') else None,
+                        'release_id': release.get('id') or None,
                         'title': release.get('title', 'Unknown'),
                         'price_value': float(listing.get('price', {}).get('value', 0)),
                         'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -374,7 +380,7 @@ class DiscogsService:
                     release = listing.get('release', {})
                     inventory.append({
                         'id': str(listing.get('id')),
-                        'release_id': str(release.get('id')) if release.get('id') else None,
+                        'release_id': release.get('id') or None,
                         'title': release.get('title', 'Unknown'),
                         'price_value': float(listing.get('price', {}).get('value', 0)),
                         'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -475,7 +481,7 @@ class DiscogsService:
                             
                             detailed_listings.append({
                                 'id': str(listing.get('id')),
-                                'release_id': str(release.get('id')) if release.get('id') else None,
+                                'release_id': release.get('id') or None,
                                 'title': release.get('title', 'Unknown'),
                                 'price_value': float(listing.get('price', {}).get('value', 0)),
                                 'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -551,7 +557,7 @@ class DiscogsService:
                         release = listing.get('release', {})
                         new_listings.append({
                             'id': str(listing.get('id')),
-                            'release_id': str(release.get('id')) if release.get('id') else None,
+                            'release_id': release.get('id') or None,
                             'title': release.get('title', 'Unknown'),
                             'price_value': float(listing.get('price', {}).get('value', 0)),
                             'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -708,7 +714,7 @@ class DiscogsService:
                             release = listing.get('release', {})
                             processed_item = {
                                 'id': listing_id,
-                                'release_id': str(release.get('id')) if release.get('id') else None,
+                                'release_id': release.get('id') or None,
                                 'title': release.get('title', 'Unknown'),
                                 'price_value': float(listing.get('price', {}).get('value', 0)),
                                 'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -762,7 +768,7 @@ class DiscogsService:
                             release = listing.get('release', {})
                             processed_item = {
                                 'id': listing_id,
-                                'release_id': str(release.get('id')) if release.get('id') else None,
+                                'release_id': release.get('id') or None,
                                 'title': release.get('title', 'Unknown'),
                                 'price_value': float(listing.get('price', {}).get('value', 0)),
                                 'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -828,7 +834,7 @@ class DiscogsService:
                         release = listing.get('release', {})
                         processed_item = {
                             'id': str(listing.get('id')),
-                            'release_id': str(release.get('id')) if release.get('id') else None,
+                            'release_id': release.get('id') or None,
                             'title': release.get('title', 'Unknown'),
                             'price_value': float(listing.get('price', {}).get('value', 0)),
                             'currency': listing.get('price', {}).get('currency', 'USD'),
@@ -9,6 +9,7 @@ from sqlalchemy import and_, or_
 from datetime import datetime, timedelta, timezone
 import json
 import hashlib
+import time
 
 class WantlistMatchingService:
     """Service for matching user wantlist with seller listings"""
@@ -163,41 +164,34 @@ class WantlistMatchingService:
             matches = []
             total_matches = 0
             
-            # Create a set of wantlist release IDs for fast lookup
-            wantlist_release_ids = set()
-            for wantlist_item in wantlist:
-                release_id = wantlist_item.get('release_id')
-                if release_id:
-                    wantlist_release_ids.add(str(release_id))
+            # Index wantlist items by release ID for O(1) lookup
+            wantlist_by_release_id = self._index_wantlist_by_release_id(wantlist)
             
             # Process inventory items
             for item in seller_inventory:
-                item_release_id = str(item.get('release_id', ''))
+                item_release_id = item.get('release_id')
                 
                 # Fast path: exact release ID match
-                if item_release_id and item_release_id in wantlist_release_ids:
-                    # Find the matching wantlist item
-                    for wantlist_item in wantlist:
-                        if str(wantlist_item.get('release_id', '')) == item_release_id:
-                            matches.append({
-                                'listing_id': item.get('id'),
-                                'release_id': item.get('release_id'),
-                                'title': item.get('title'),
-                                'artist': item.get('artist', 'Unknown'),
-                                'price_value': item.get('price_value'),
-                                'currency': item.get('currency'),
-                                'media_condition': item.get('media_condition'),
-                                'sleeve_condition': item.get('sleeve_condition'),
-                                'listing_url': item.get('listing_url'),
-                                'status': item.get('status'),
-                                'wantlist_item': {
-                                    'id': wantlist_item.get('id'),
-                                    'title': wantlist_item.get('title'),
-                                    'artist': wantlist_item.get('artist')
-                                }
-                            })
-                            total_matches += 1
-                            break
+                wantlist_item = wantlist_by_release_id.get(item_release_id) if item_release_id else None
+                if wantlist_item is not None:
+                    matches.append({
+                        'listing_id': item.get('id'),
+                        'release_id': item.get('release_id'),
+                        'title': item.get('title'),
+                        'artist': item.get('artist', 'Unknown'),
+                        'price_value': item.get('price_value'),
+                        'currency': item.get('currency'),
+                        'media_condition': item.get('media_condition'),
+                        'sleeve_condition': item.get('sleeve_condition'),
+                        'listing_url': item.get('listing_url'),
+                        'status': item.get('status'),
+                        'wantlist_item': {
+                            'id': wantlist_item.get('id'),
+                            'title': wantlist_item.get('title'),
+                            'artist': wantlist_item.get('artist')
+                        }
+                    })
+                    total_matches += 1
                 else:
                     # Slow path: fuzzy matching only if no release ID match
                     for wantlist_item in wantlist:
@@ -249,7 +243,7 @@ class WantlistMatchingService:
     def _find_matches_for_seller_inventory(self, order, wantlist, user, bypass_cache=False):
         """Find wantlist matches for a seller's entire inventory"""
         try:
-            current_app.logger.info(f"Checking seller {order.seller_name} inventory for wantlist matches")
+            current_app.logger.info("Checking seller %s inventory for wantlist matches", order.seller_name)
             
             # Get seller's inventory (cached or fresh)
             seller_inventory, metadata = self._get_incremental_seller_inventory(
@@ -274,40 +268,11 @@ class WantlistMatchingService:
             
             current_app.logger.info(f"Found {len(seller_inventory)} items in {order.seller_name}'s inventory")
             
-            # Match inventory against wantlist
-            matches = []
-            total_matches = 0
-            
-            # Create a set of wantlist release IDs for efficient lookup
-            wantlist_release_ids = {str(item.get('release_id')) for item in wantlist if item.get('release_id')}
-            
-            for inventory_item in seller_inventory:
-                release_id = str(inventory_item.get('release_id', ''))
-                if release_id and release_id in wantlist_release_ids:
-                    # Find the matching wantlist item
-                    for want_item in wantlist:
-                        if str(want_item.get('release_id')) == release_id:
-                            matches.append({
-                                'listing_id': inventory_item.get('id'),
-                                'listing_title': inventory_item.get('title'),
-                                'listing_price': inventory_item.get('price_value'),
-                                'listing_currency': inventory_item.get('currency'),
-                                'listing_condition': f"{inventory_item.get('media_condition')} / {inventory_item.get('sleeve_condition')}",
-                                'listing_url': inventory_item.get('listing_url'),
-                                'wantlist_item': {
-                                    'id': want_item.get('id'),
-                                    'title': want_item.get('title'),
-                                    'artists': want_item.get('artists', []),
-                                    'year': want_item.get('year'),
-                                    'format': want_item.get('format'),
-                                    'thumb': want_item.get('thumb'),
-                                    'date_added': want_item.get('date_added')
-                                },
-                                'match_confidence': 'exact'
-                            })
-                            total_matches += 1
-                            current_app.logger.info(f"Match found: {inventory_item.get('title')} (release_id: {release_id})")
-                            break
+            # Match inventory against wantlist, indexed by release ID for O(1) lookup
+            matches = self._match_inventory_by_release_id(
+                seller_inventory, self._index_wantlist_by_release_id(wantlist)
+            )
+            total_matches = len(matches)
             
             current_app.logger.info(f"Seller {order.seller_name}: {total_matches} matches out of {len(seller_inventory)} inventory items")
             return {
@@ -345,36 +310,86 @@ class WantlistMatchingService:
             current_app.logger.warning(f"Listing {listing.id} has no release_id, skipping")
             return matches
         
-        # Create a set of wantlist release IDs for efficient lookup
-        wantlist_release_ids = {str(want_item.get('release_id')) for want_item in wantlist if want_item.get('release_id')}
-        
-        # Check if this listing's release ID is in the wantlist
-        if str(listing.release_id) in wantlist_release_ids:
-            # Find the matching wantlist item
-            for want_item in wantlist:
-                if str(want_item.get('release_id')) == str(listing.release_id):
-                    matches.append({
-                        'listing_id': listing.id,
-                        'listing_title': listing.title,
-                        'listing_price': listing.price_value,
-                        'listing_currency': listing.currency,
-                        'listing_condition': f"{listing.media_condition} / {listing.sleeve_condition}",
-                        'wantlist_item': {
-                            'id': want_item.get('id'),
-                            'title': want_item.get('title'),
-                            'artists': want_item.get('artists', []),
-                            'year': want_item.get('year'),
-                            'format': want_item.get('format'),
-                            'thumb': want_item.get('thumb'),
-                            'date_added': want_item.get('date_added')
-                        },
-                        'match_confidence': 'exact'  # Perfect match by release ID
-                    })
-                    current_app.logger.info(f"Exact match found: {listing.title} (release_id: {listing.release_id})")
-                    break
+        # Look up the matching wantlist item by release ID (stored as a string on Listing)
+        try:
+            release_id = int(listing.release_id)
+        except ValueError:
+            return matches
+        want_item = self._index_wantlist_by_release_id(wantlist).get(release_id)
+        if want_item is not None:
+            matches.append({
+                'listing_id': listing.id,
+                'listing_title': listing.title,
+                'listing_price': listing.price_value,
+                'listing_currency': listing.currency,
+                'listing_condition': f"{listing.media_condition} / {listing.sleeve_condition}",
+                'wantlist_item': {
+                    'id': want_item.get('id'),
+                    'title': want_item.get('title'),
+                    'artists': want_item.get('artists', []),
+                    'year': want_item.get('year'),
+                    'format': want_item.get('format'),
+                    'thumb': want_item.get('thumb'),
+                    'date_added': want_item.get('date_added')
+                },
+                'match_confidence': 'exact'  # Perfect match by release ID
+            })
+            current_app.logger.debug("Exact match found: %s (release_id: %s)", listing.title, listing.release_id)
         
         return matches
     
+    def _match_inventory_by_release_id(self, inventory, wantlist_by_release_id):
+        """Match inventory items against a release ID index of the wantlist"""
+        matches = []
+        append = matches.append
+        lookup = wantlist_by_release_id.get
+        build = self._build_inventory_match
+        logger = current_app.logger
+        for inventory_item in inventory:
+            release_id = inventory_item.get('release_id')
+            if not release_id:
+                continue
+            want_item = lookup(release_id)
+            if want_item is not None:
+                append(build(inventory_item, want_item))
+                logger.debug("Match found: %s (release_id: %s)", inventory_item.get('title'), release_id)
+        return matches
+    
+    def _build_inventory_match(self, inventory_item, want_item):
+        """Build the match payload for an inventory item matched by release ID"""
+        get = inventory_item.get
+        want_get = want_item.get
+        return {
+            'listing_id': get('id'),
+            'listing_title': get('title'),
+            'listing_price': get('price_value'),
+            'listing_currency': get('currency'),
+            'listing_condition': "%s / %s" % (get('media_condition'), get('sleeve_condition')),
+            'listing_url': get('listing_url'),
+            'wantlist_item': {
+                'id': want_get('id'),
+                'title': want_get('title'),
+                'artists': want_get('artists', []),
+                'year': want_get('year'),
+                'format': want_get('format'),
+                'thumb': want_get('thumb'),
+                'date_added': want_get('date_added')
+            },
+            'match_confidence': 'exact'
+        }
+    
+    def _index_wantlist_by_release_id(self, wantlist):
+        """Index wantlist items by release ID (first item wins, one dict lookup per item)
+        
+        Release IDs are ints as returned by discogs_service, so no string casting is needed.
+        """
+        index = {}
+        for want_item in wantlist:
+            release_id = want_item.get('release_id')
+            if release_id:
+                index.setdefault(release_id, want_item)
+        return index
+    
     def _is_similar_title(self, title1, title2):
         """Check if two titles are similar"""
         # Remove common words and special characters
@@ -482,18 +497,40 @@ class WantlistMatchingService:
         
         return None
     
+    def _hash_seller_name(self, seller_name):
+        """Short, key-safe digest of a seller name (names may contain spaces/punctuation)"""
+        return hashlib.blake2b(seller_name.encode(), digest_size=8).hexdigest()
+
     def _get_seller_inventory_cache_key(self, seller_name, user_id):
         """Generate cache key for seller inventory"""
-        return f"seller_inventory:{seller_name}:{user_id}"
-    
+        return f"si:{self._hash_seller_name(seller_name)}:{user_id}"
+
     def _get_seller_inventory_metadata_key(self, seller_name):
         """Generate cache key for seller inventory metadata"""
-        return f"seller_metadata:{seller_name}"
+        return f"sm:{self._hash_seller_name(seller_name)}"
     
     def _is_large_seller(self, inventory_count):
         """Check if seller has large inventory (10k+ items)"""
         return inventory_count >= 10000
     
+    def _get_cache_duration(self, inventory_count):
+        """Get how long (in seconds) a seller's cached inventory stays fresh"""
+        return self.large_seller_cache_duration if self._is_large_seller(inventory_count) else self.inventory_cache_duration
+    
+    def _is_cache_stale(self, metadata):
+        """Check if cached inventory metadata is older than its cache duration"""
+        cached_at_epoch = metadata.get('cached_at_epoch')
+        cache_duration = metadata.get('cache_duration_seconds')
+        if cached_at_epoch is None or cache_duration is None:
+            # Metadata cached before the epoch/duration fields were stored
+            cache_duration = self._get_cache_duration(metadata.get('count', 0))
+            cached_at = datetime.fromisoformat(metadata['cached_at'])
+            if cached_at.tzinfo is None:
+                cached_at = cached_at.replace(tzinfo=timezone.utc)
+            cached_at_epoch = cached_at.timestamp()
+        
+        return time.time() - cached_at_epoch > cache_duration
+    
     def _is_seller_too_large_for_api(self, total_pages):
         """Check if seller exceeds Discogs API pagination limit (100 pages)"""
         return total_pages > 100
@@ -542,16 +579,9 @@ class WantlistMatchingService:
                 return None, None
             
             metadata = json.loads(metadata)
-            cache_duration = self.large_seller_cache_duration if self._is_large_seller(metadata.get('count', 0)) else self.inventory_cache_duration
             
             # Check if cache is still valid
-            cached_at = datetime.fromisoformat(metadata['cached_at'])
-            if cached_at.tzinfo is None:
-                cached_at = cached_at.replace(tzinfo=timezone.utc)
-            
-            # Ensure both datetimes are timezone-aware for comparison
-            now = datetime.now(timezone.utc)
-            if now - cached_at > timedelta(seconds=cache_duration):
+            if self._is_cache_stale(metadata):
                 return None, None
             
             # Get cached inventory
@@ -604,6 +634,8 @@ class WantlistMatchingService:
                     'count': len(inventory),
                     'cached_at': datetime.now(timezone.utc).isoformat(),
                     'last_updated': datetime.now(timezone.utc).isoformat(),
+                    'cached_at_epoch': time.time(),
+                    'cache_duration_seconds': self._get_cache_duration(len(inventory)),
                     'is_large_seller': self._is_large_seller(len(inventory)),
                     'listing_ids': [item['id'] for item in inventory],
                     'most_recent_listing_date': most_recent_date
@@ -637,6 +669,8 @@ class WantlistMatchingService:
                     'count': len(inventory),
                     'cached_at': datetime.now(timezone.utc).isoformat(),
                     'last_updated': datetime.now(timezone.utc).isoformat(),
+                    'cached_at_epoch': time.time(),
+                    'cache_duration_seconds': self._get_cache_duration(len(inventory)),
                     'is_large_seller': self._is_large_seller(len(inventory)),
                     'listing_ids': [item['id'] for item in inventory],
                     'most_recent_listing_date': most_recent_date
@@ -647,14 +681,7 @@ class WantlistMatchingService:
                 return inventory, metadata
             
             # Check if cache is still fresh (within 1 hour for regular sellers, 2 hours for large)
-            cache_duration = self.large_seller_cache_duration if metadata.get('is_large_seller', False) else self.inventory_cache_duration
-            cached_at = datetime.fromisoformat(metadata['cached_at'])
-            if cached_at.tzinfo is None:
-                cached_at = cached_at.replace(tzinfo=timezone.utc)
-            
-            # Ensure both datetimes are timezone-aware for comparison
-            now = datetime.now(timezone.utc)
-            if now - cached_at <= timedelta(seconds=cache_duration):
+            if not self._is_cache_stale(metadata):
                 current_app.logger.info(f"✅ CACHE HIT for {seller_name} ({len(cached_inventory)} items) - using cached data")
                 return cached_inventory, metadata
             
@@ -670,6 +697,8 @@ class WantlistMatchingService:
                 # No new listings - update cache timestamp and return cached data
                 current_app.logger.info(f"No new listings found for {seller_name}, updating cache timestamp")
                 metadata['cached_at'] = datetime.now(timezone.utc).isoformat()
+                metadata['cached_at_epoch'] = time.time()
+                metadata['cache_duration_seconds'] = self._get_cache_duration(len(cached_inventory))
                 metadata['last_updated'] = datetime.now(timezone.utc).isoformat()
                 self._cache_seller_inventory(seller_name, user_id, cached_inventory, metadata)
                 return cached_inventory, metadata
@@ -677,8 +706,17 @@ class WantlistMatchingService:
             # New listings found - merge with cached data
             current_app.logger.info(f"Found {len(new_listings)} new listings for {seller_name} (checked {total_checked} items)")
             
-            # Merge new listings with cached inventory
-            updated_inventory = cached_inventory + new_listings
+            # Merge new listings into the cached inventory in place (it was freshly decoded
+            # from the cache, so extending it avoids copying the full inventory)
+            updated_inventory = cached_inventory
+            updated_inventory.extend(new_listings)
+            
+            # Only the new listings' IDs need to be appended to the cached ID list
+            listing_ids = metadata.get('listing_ids')
+            if listing_ids is None:
+                listing_ids = [item['id'] for item in updated_inventory]
+            else:
+                listing_ids.extend(item['id'] for item in new_listings)
             
             # Find new most recent listing date
             most_recent_date = metadata.get('most_recent_listing_date')
@@ -692,8 +730,10 @@ class WantlistMatchingService:
                 'count': len(updated_inventory),
                 'cached_at': datetime.now(timezone.utc).isoformat(),
                 'last_updated': datetime.now(timezone.utc).isoformat(),
+                'cached_at_epoch': time.time(),
+                'cache_duration_seconds': self._get_cache_duration(len(updated_inventory)),
                 'is_large_seller': self._is_large_seller(len(updated_inventory)),
-                'listing_ids': [item['id'] for item in updated_inventory],
+                'listing_ids': listing_ids,
                 'most_recent_listing_date': most_recent_date
             })
             
@@ -736,6 +776,8 @@ class WantlistMatchingService:
                 'count': len(inventory),
                 'cached_at': datetime.now(timezone.utc).isoformat(),
                 'last_updated': datetime.now(timezone.utc).isoformat(),
+                'cached_at_epoch': time.time(),
+                'cache_duration_seconds': self._get_cache_duration(len(inventory)),
                 'is_large_seller': self._is_large_seller(len(inventory)),
                 'listing_ids': [item['id'] for item in inventory],
                 'most_recent_listing_date': most_recent_date
@@ -773,14 +815,7 @@ class WantlistMatchingService:
                 return self.force_refresh_seller_inventory(seller_name, user_id, access_token, access_secret)
             
             # Check if cache is stale
-            cache_duration = self.large_seller_cache_duration if metadata.get('is_large_seller', False) else self.inventory_cache_duration
-            cached_at = datetime.fromisoformat(metadata['cached_at'])
-            if cached_at.tzinfo is None:
-                cached_at = cached_at.replace(tzinfo=timezone.utc)
-            
-            # Ensure both datetimes are timezone-aware for comparison
-            now = datetime.now(timezone.utc)
-            if now - cached_at > timedelta(seconds=cache_duration):
+            if self._is_cache_stale(metadata):
                 return self.force_refresh_seller_inventory(seller_name, user_id, access_token, access_secret)
             
             # Cache is still fresh
@@ -1,11 +1,25 @@
-import json
+import orjson
 import re
+import ahocorasick
 from datetime import datetime, timezone, timedelta
-from difflib import SequenceMatcher
+from rapidfuzz import fuzz, process
 from flask import current_app
+from sqlalchemy import text
 from models import db, WantlistItem, WantlistReference, Listing, User
 from .discogs_service import discogs_service
-from .cache_service import cache_result
+from .cache_service import cache_service
+
+# Precompiled patterns used in the matching hot loop
+_YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+_NONWORD_RE = re.compile(r'[^\w\s]')
+
+# Minimum confidence for a listing to be considered a wantlist match
+MATCH_CONFIDENCE_THRESHOLD = 0.7
+
+# Confidence weights: title similarity dominates, artist/year are bonuses
+TITLE_WEIGHT = 0.6
+ARTIST_BONUS = 0.3
+YEAR_BONUS = 0.1
 
 class WantlistService:
     """Service for managing user wantlists and finding references in seller listings"""
@@ -19,7 +33,6 @@ class WantlistService:
             return
         self._initialized = True
     
-    @cache_result(expire_seconds=1800)  # 30 minutes
     def sync_user_wantlist(self, user_id, force_refresh=False):
         """Sync user's wantlist from Discogs to local database"""
         try:
@@ -32,53 +45,32 @@ class WantlistService:
                 raise Exception("User not found")
             
             # Check if we need to refresh (force or last sync was more than 30 minutes ago)
-            if not force_refresh:
-                last_sync = db.session.query(db.func.max(WantlistItem.last_checked)).filter_by(user_id=user_id).scalar()
-                if last_sync and (datetime.now(timezone.utc) - last_sync).total_seconds() < 1800:
-                    current_app.logger.info(f"Wantlist for user {user_id} is up to date")
-                    return self.get_user_wantlist(user_id)
-            
-            # Fetch wantlist from Discogs
-            discogs_wantlist = discogs_service.get_user_wantlist(
-                user_id, 
-                user.discogs_username, 
-                user.discogs_access_token, 
+            if not force_refresh and not self.needs_sync(user_id):
+                current_app.logger.info(f"Wantlist for user {user_id} is up to date")
+                return self.get_user_wantlist(user_id)
+            
+            # Load all existing items in one query instead of one lookup per want
+            existing_items = {
+                item.discogs_want_id: item
+                for item in WantlistItem.query.filter_by(user_id=user_id).all()
+            }
+            
+            # Stream the wantlist from Discogs page by page, writing each page as
+            # it arrives instead of holding the whole wantlist in memory first
+            synced_items = []
+            wantlist_pages = discogs_service.iter_user_wantlist(
+                user.discogs_username,
+                user.discogs_access_token,
                 user.discogs_access_secret
             )
+            for wantlist_page in wantlist_pages:
+                synced_items.extend(self._upsert_wantlist_page(user_id, wantlist_page, existing_items))
+                db.session.flush()
             
-            if not discogs_wantlist:
+            if not synced_items:
                 current_app.logger.warning(f"No wantlist data found for user {user_id}")
                 return []
             
-            # Process and store wantlist items
-            synced_items = []
-            for want_data in discogs_wantlist:
-                # Check if item already exists
-                existing_item = WantlistItem.query.filter_by(
-                    user_id=user_id,
-                    discogs_want_id=str(want_data['id'])
-                ).first()
-                
-                if existing_item:
-                    # Update existing item
-                    existing_item.update_from_discogs_data(want_data)
-                    synced_items.append(existing_item)
-                else:
-                    # Create new item
-                    new_item = WantlistItem(
-                        user_id=user_id,
-                        discogs_want_id=str(want_data['id']),
-                        release_id=str(want_data['release_id']),
-                        title=want_data['title'],
-                        artists=json.dumps(want_data['artists']),
-                        year=want_data['year'],
-                        format=want_data['format'],
-                        thumb_url=want_data['thumb'],
-                        date_added=datetime.fromisoformat(want_data['date_added'].replace('Z', '+00:00')) if want_data.get('date_added') else None
-                    )
-                    db.session.add(new_item)
-                    synced_items.append(new_item)
-            
             db.session.commit()
             current_app.logger.info(f"Synced {len(synced_items)} wantlist items for user {user_id}")
             
@@ -89,13 +81,80 @@ class WantlistService:
             current_app.logger.error(f"Error syncing wantlist for user {user_id}: {e}")
             raise Exception(f"Error syncing wantlist: {e}")
     
+    def needs_sync(self, user_id):
+        """Check whether the user's wantlist was last synced more than 30 minutes ago"""
+        last_sync = db.session.query(db.func.max(WantlistItem.last_checked)).filter_by(user_id=user_id).scalar()
+        if not last_sync:
+            return True
+        # last_checked is a naive column; values are stored as UTC
+        if last_sync.tzinfo is None:
+            last_sync = last_sync.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - last_sync).total_seconds() >= 1800
+    
+    def _upsert_wantlist_page(self, user_id, wantlist_page, existing_items):
+        """Update or create WantlistItems for one page of Discogs wants"""
+        synced_items = []
+        new_items = []
+        for want_data in wantlist_page:
+            discogs_want_id = str(want_data['id'])
+            date_added = self._parse_discogs_date(want_data.get('date_added'))
+            
+            existing_item = existing_items.get(discogs_want_id)
+            if existing_item:
+                # Update existing item
+                existing_item.update_from_discogs_data({**want_data, 'date_added': date_added})
+                synced_items.append(existing_item)
+            else:
+                # Create new item
+                new_item = WantlistItem(
+                    user_id=user_id,
+                    discogs_want_id=discogs_want_id,
+                    release_id=str(want_data['release_id']),
+                    title=want_data['title'],
+                    artists=orjson.dumps(want_data['artists']).decode(),
+                    year=want_data['year'],
+                    format=want_data['format'],
+                    thumb_url=want_data['thumb'],
+                    date_added=date_added
+                )
+                # Guard against the same want showing up on two pages
+                existing_items[discogs_want_id] = new_item
+                new_items.append(new_item)
+                synced_items.append(new_item)
+        
+        db.session.add_all(new_items)
+        return synced_items
+    
+    def _parse_discogs_date(self, value):
+        """Parse an ISO 8601 date string from the Discogs API"""
+        if not value:
+            return None
+        # Python 3.11+ parses a trailing 'Z' natively, no string rewrite needed
+        return datetime.fromisoformat(value)
+    
     def get_user_wantlist(self, user_id):
         """Get user's wantlist from local database"""
         try:
             self._setup_service()
             
+            # Cache keyed by the latest sync time and the item count, so both a
+            # sync and a deleted item invalidate it
+            last_checked, item_count = db.session.query(
+                db.func.max(WantlistItem.last_checked),
+                db.func.count(WantlistItem.id)
+            ).filter_by(user_id=user_id).one()
+            if last_checked is None:
+                return []
+            
+            cache_key = f"wl:{user_id}:{int(last_checked.timestamp())}:{item_count}"
+            cached_items = cache_service.get(cache_key)
+            if cached_items is not None:
+                return cached_items
+            
             items = WantlistItem.query.filter_by(user_id=user_id).order_by(WantlistItem.date_added.desc()).all()
-            return [item.to_dict() for item in items]
+            wantlist = [item.to_dict() for item in items]
+            cache_service.set(cache_key, wantlist, expire_seconds=1800)  # 30 minutes
+            return wantlist
             
         except Exception as e:
             current_app.logger.error(f"Error getting wantlist for user {user_id}: {e}")
@@ -106,13 +165,16 @@ class WantlistService:
         try:
             self._setup_service()
             
-            # Get user's wantlist items
-            wantlist_items = WantlistItem.query.filter_by(user_id=user_id).all()
+            # Get user's wantlist items (only the columns used for matching,
+            # as plain rows rather than hydrated ORM objects)
+            wantlist_items = db.session.query(
+                WantlistItem.id, WantlistItem.title, WantlistItem.year, WantlistItem.artists
+            ).filter_by(user_id=user_id).all()
             if not wantlist_items:
                 return []
             
             # Get all active listings (optionally filtered by order)
-            query = Listing.query.filter_by(status='For Sale')
+            query = db.session.query(Listing.id, Listing.title).filter_by(status='For Sale')
             if order_id:
                 query = query.filter_by(order_id=order_id)
             
@@ -121,34 +183,75 @@ class WantlistService:
                 return []
             
             references = []
+            new_references = []
+            
+            # Load the user's existing references once instead of querying per match
+            existing_refs = {
+                (ref.wantlist_item_id, ref.listing_id): ref
+                for ref in WantlistReference.query.filter_by(user_id=user_id).all()
+            }
             
-            for wantlist_item in wantlist_items:
-                for listing in listings:
-                    # Check if this listing matches the wantlist item
-                    match_confidence = self._calculate_match_confidence(wantlist_item, listing)
+            # Normalize titles once, then index listings by title token so each
+            # wantlist item is only scored against listings sharing a token with it
+            prepared_wantlist = [
+                self._prepare_wantlist_item(idx, wantlist_item)
+                for idx, wantlist_item in enumerate(wantlist_items)
+            ]
+            prepared_listings = [self._prepare_listing(listing) for listing in listings]
+            listing_index = self._build_listing_index(prepared_listings)
+            
+            # Scan each listing title once for every wantlist artist
+            artist_automaton = self._build_artist_automaton(prepared_wantlist)
+            if artist_automaton is not None:
+                for listing_data in prepared_listings:
+                    artist_hits = listing_data['artist_hits']
+                    for _, wantlist_positions in artist_automaton.iter(listing_data['title_lc']):
+                        artist_hits.update(wantlist_positions)
+            
+            # On PostgreSQL, let the trigram index pick candidate pairs instead
+            trigram_candidates = self._get_trigram_candidates(user_id, order_id)
+            if trigram_candidates is not None:
+                listing_positions = {listing.id: idx for idx, listing in enumerate(listings)}
+            
+            for wanted in prepared_wantlist:
+                wantlist_item = wanted['item']
+                
+                candidate_ids = set()
+                if trigram_candidates is not None:
+                    for listing_id in trigram_candidates.get(wantlist_item.id, ()):
+                        if listing_id in listing_positions:
+                            candidate_ids.add(listing_positions[listing_id])
+                else:
+                    for token in wanted['tokens']:
+                        candidate_ids.update(listing_index.get(token, ()))
+                
+                # Score all candidates for this wantlist item in one batch
+                for listing_idx, match_confidence in self._score_candidates(
+                    wanted, sorted(candidate_ids), prepared_listings
+                ):
+                    listing = prepared_listings[listing_idx]['listing']
+                    
+                    # Check if reference already exists
+                    existing_ref = existing_refs.get((wantlist_item.id, listing.id))
                     
-                    if match_confidence > 0.7:  # Threshold for considering it a match
-                        # Check if reference already exists
-                        existing_ref = WantlistReference.query.filter_by(
+                    if not existing_ref:
+                        # Create new reference
+                        reference = WantlistReference(
                             wantlist_item_id=wantlist_item.id,
-                            listing_id=listing.id
-                        ).first()
-                        
-                        if not existing_ref:
-                            # Create new reference
-                            reference = WantlistReference(
-                                wantlist_item_id=wantlist_item.id,
-                                listing_id=listing.id,
-                                user_id=user_id,
-                                match_confidence=match_confidence
-                            )
-                            db.session.add(reference)
-                            references.append(reference)
-                        else:
-                            # Update existing reference confidence
-                            existing_ref.match_confidence = match_confidence
-                            references.append(existing_ref)
-            
+                            listing_id=listing.id,
+                            user_id=user_id,
+                            match_confidence=match_confidence
+                        )
+                        new_references.append(reference)
+                        references.append(reference)
+                    else:
+                        # Update existing reference confidence
+                        existing_ref.match_confidence = match_confidence
+                        references.append(existing_ref)
+            
+            # Insert new references in one batch; they stay attached to the session
+            # so to_dict() can still load their relationships
+            db.session.add_all(new_references)
             db.session.commit()
             return [ref.to_dict() for ref in references]
             
@@ -157,77 +260,191 @@ class WantlistService:
             current_app.logger.error(f"Error finding references for user {user_id}: {e}")
             return []
     
-    def _calculate_match_confidence(self, wantlist_item, listing):
-        """Calculate how confident we are that a listing matches a wantlist item"""
+    def _get_trigram_candidates(self, user_id, order_id=None):
+        """Get candidate (wantlist item, listing) pairs using the pg_trgm index
+        
+        Returns a dict of wantlist_item_id -> set of listing ids, or None when not
+        running on PostgreSQL or when pg_trgm is unavailable.
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return None
+        
+        sql = """
+            SELECT wi.id, l.id
+            FROM wantlist_item wi
+            JOIN listing l ON wi.title % l.title
+            WHERE wi.user_id = :user_id AND l.status = 'For Sale'
+        """
+        params = {'user_id': user_id}
+        if order_id:
+            sql += " AND l.order_id = :order_id"
+            params['order_id'] = order_id
+        
         try:
-            confidence = 0.0
-            
-            # Title similarity (most important)
-            title_similarity = self._text_similarity(wantlist_item.title, listing.title)
-            confidence += title_similarity * 0.6
-            
-            # Artist matching
-            if wantlist_item.artists:
-                artists = json.loads(wantlist_item.artists)
-                if artists:
-                    # Check if any artist from wantlist appears in listing title
-                    artist_found = any(artist.lower() in listing.title.lower() for artist in artists)
-                    if artist_found:
-                        confidence += 0.3
-            
-            # Year matching
-            if wantlist_item.year and listing.title:
-                # Try to extract year from listing title
-                year_match = re.search(r'\b(19|20)\d{2}\b', listing.title)
-                if year_match:
-                    listing_year = int(year_match.group())
-                    if abs(wantlist_item.year - listing_year) <= 1:  # Within 1 year
-                        confidence += 0.1
-            
-            return min(confidence, 1.0)  # Cap at 1.0
-            
+            # Savepoint so a missing extension doesn't abort the outer transaction
+            with db.session.begin_nested():
+                rows = db.session.execute(text(sql), params).all()
         except Exception as e:
-            current_app.logger.error(f"Error calculating match confidence: {e}")
-            return 0.0
+            current_app.logger.warning(f"Trigram candidate query failed, falling back to token index: {e}")
+            return None
+        
+        candidates = {}
+        for wantlist_item_id, listing_id in rows:
+            candidates.setdefault(wantlist_item_id, set()).add(listing_id)
+        return candidates
+    
+    def _prepare_wantlist_item(self, position, wantlist_item):
+        """Precompute the normalized fields of a wantlist item used for matching"""
+        artists = []
+        if wantlist_item.artists:
+            try:
+                artists = orjson.loads(wantlist_item.artists) or []
+            except ValueError:
+                current_app.logger.warning(f"Invalid artists JSON for wantlist item {wantlist_item.id}")
+        
+        title_norm = _NONWORD_RE.sub('', wantlist_item.title.lower()) if wantlist_item.title else None
+        artists_lc = [artist.lower() for artist in artists if artist]
+        
+        # Title similarity needed to pass the threshold with the best bonuses this
+        # item can get (above 1.0 means it can never match)
+        max_bonus = (ARTIST_BONUS if artists_lc else 0.0) + (YEAR_BONUS if wantlist_item.year else 0.0)
+        min_title_similarity = (MATCH_CONFIDENCE_THRESHOLD - max_bonus) / TITLE_WEIGHT
+        
+        return {
+            'position': position,
+            'item': wantlist_item,
+            'title_norm': title_norm,
+            'tokens': set(title_norm.split()) if title_norm else set(),
+            'artists_lc': artists_lc,
+            'year': wantlist_item.year,
+            'min_title_similarity': min_title_similarity
+        }
     
-    def _text_similarity(self, text1, text2):
-        """Calculate text similarity between two strings"""
-        if not text1 or not text2:
-            return 0.0
+    def _prepare_listing(self, listing):
+        """Precompute the normalized title fields of a listing used for matching"""
+        title = listing.title
+        if not title:
+            return {'listing': listing, 'title_lc': '', 'title_norm': None, 'year': None, 'artist_hits': set()}
         
-        # Normalize text
-        text1 = re.sub(r'[^\w\s]', '', text1.lower())
-        text2 = re.sub(r'[^\w\s]', '', text2.lower())
+        title_lc = title.lower()
+        year_match = _YEAR_RE.search(title)
+        return {
+            'listing': listing,
+            'title_lc': title_lc,
+            'title_norm': _NONWORD_RE.sub('', title_lc),
+            'year': int(year_match.group()) if year_match else None,
+            'artist_hits': set()  # Positions of wantlist items whose artist appears in the title
+        }
+    
+    def _score_candidates(self, wanted, candidate_positions, prepared_listings):
+        """Score a wantlist item against its candidate listings in one batch
+        
+        Title similarity for all candidates is computed by a single RapidFuzz call,
+        which drops pairs below the item's min_title_similarity without returning
+        them to Python. Returns (listing position, confidence) pairs above
+        MATCH_CONFIDENCE_THRESHOLD, in candidate order.
+        """
+        wanted_title = wanted['title_norm']
+        min_title_similarity = wanted['min_title_similarity']
+        if wanted_title is None or not candidate_positions or min_title_similarity > 1.0:
+            return []
+        
+        # Many listings share a title (reissues, several copies of one release),
+        # so score each distinct title once and fan the score out
+        positions_by_title = {}
+        for listing_idx in candidate_positions:
+            title = prepared_listings[listing_idx]['title_norm']
+            if title is not None:
+                positions_by_title.setdefault(title, []).append(listing_idx)
         
-        return SequenceMatcher(None, text1, text2).ratio()
+        title_scores = process.extract(
+            wanted_title, list(positions_by_title),
+            scorer=fuzz.ratio,
+            score_cutoff=min_title_similarity * 100,
+            limit=None
+        )
+        
+        scored = []
+        for title, title_score, _ in title_scores:
+            for listing_idx in positions_by_title[title]:
+                confidence = title_score / 100.0 * TITLE_WEIGHT + self._match_bonus(wanted, prepared_listings[listing_idx])
+                confidence = min(confidence, 1.0)  # Cap at 1.0
+                if confidence > MATCH_CONFIDENCE_THRESHOLD:
+                    scored.append((listing_idx, confidence))
+        
+        scored.sort()
+        return scored
+    
+    def _match_bonus(self, wanted, listing_data):
+        """Confidence bonus from artist and year matches between a wantlist item and a listing"""
+        bonus = 0.0
+        
+        # Artist matching: any artist from wantlist appears in listing title
+        if wanted['position'] in listing_data['artist_hits']:
+            bonus += ARTIST_BONUS
+        
+        # Year matching (year extracted from listing title)
+        listing_year = listing_data['year']
+        if wanted['year'] and listing_year is not None:
+            if abs(wanted['year'] - listing_year) <= 1:  # Within 1 year
+                bonus += YEAR_BONUS
+        
+        return bonus
+    
+    def _build_artist_automaton(self, prepared_wantlist):
+        """Build an Aho-Corasick automaton mapping artist names to wantlist positions"""
+        positions_by_artist = {}
+        for wanted in prepared_wantlist:
+            for artist in wanted['artists_lc']:
+                positions_by_artist.setdefault(artist, set()).add(wanted['position'])
+        
+        if not positions_by_artist:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for artist, positions in positions_by_artist.items():
+            automaton.add_word(artist, positions)
+        automaton.make_automaton()
+        return automaton
+    
+    def _build_listing_index(self, prepared_listings):
+        """Build an inverted index mapping title tokens to listing positions"""
+        index = {}
+        for listing_idx, listing_data in enumerate(prepared_listings):
+            if not listing_data['title_norm']:
+                continue
+            for token in set(listing_data['title_norm'].split()):
+                index.setdefault(token, set()).add(listing_idx)
+        return index
     
     def get_wantlist_stats(self, user_id):
         """Get statistics about user's wantlist and references"""
         try:
             self._setup_service()
             
-            # Count wantlist items
-            wantlist_count = WantlistItem.query.filter_by(user_id=user_id).count()
-            
-            # Count references
-            references_count = WantlistReference.query.filter_by(user_id=user_id).count()
-            
-            # Count unique listings with references
-            unique_listings = db.session.query(WantlistReference.listing_id).filter_by(user_id=user_id).distinct().count()
-            
-            # Get recent references (last 7 days)
             week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-            recent_references = WantlistReference.query.filter(
-                WantlistReference.user_id == user_id,
-                WantlistReference.created_at >= week_ago
-            ).count()
             
-            return {
-                'wantlist_items': wantlist_count,
-                'total_references': references_count,
-                'unique_listings': unique_listings,
-                'recent_references': recent_references
-            }
+            # Compute all counts as scalar subqueries of a single SELECT
+            stats = db.session.execute(db.select(
+                # Wantlist items
+                db.select(db.func.count(WantlistItem.id))
+                .where(WantlistItem.user_id == user_id)
+                .scalar_subquery().label('wantlist_items'),
+                # References
+                db.select(db.func.count(WantlistReference.id))
+                .where(WantlistReference.user_id == user_id)
+                .scalar_subquery().label('total_references'),
+                # Unique listings with references
+                db.select(db.func.count(db.distinct(WantlistReference.listing_id)))
+                .where(WantlistReference.user_id == user_id)
+                .scalar_subquery().label('unique_listings'),
+                # Recent references (last 7 days)
+                db.select(db.func.count(WantlistReference.id))
+                .where(WantlistReference.user_id == user_id, WantlistReference.created_at >= week_ago)
+                .scalar_subquery().label('recent_references')
+            )).one()
+            
+            return dict(stats._mapping)
             
         except Exception as e:
             current_app.logger.error(f"Error getting wantlist stats for user {user_id}: {e}")
@@ -246,15 +463,15 @@ class WantlistService:
             cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
             
             # Find references where the listing is no longer available
-            old_references = db.session.query(WantlistReference).join(Listing).filter(
+            old_reference_ids = db.session.query(WantlistReference.id).join(Listing).filter(
                 Listing.status != 'For Sale',
                 WantlistReference.created_at < cutoff_date
-            ).all()
+            )
             
-            deleted_count = 0
-            for ref in old_references:
-                db.session.delete(ref)
-                deleted_count += 1
+            # Delete them in a single statement instead of one DELETE per row
+            deleted_count = WantlistReference.query.filter(
+                WantlistReference.id.in_(old_reference_ids.scalar_subquery())
+            ).delete(synchronize_session=False)
             
             db.session.commit()
             current_app.logger.info(f"Cleaned up {deleted_count} old references")
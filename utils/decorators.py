@@ -1,6 +1,60 @@
+import hashlib
+import threading
+import time
+import orjson
+from collections import OrderedDict, deque
 from functools import wraps
-from flask import redirect, url_for, jsonify, request, current_app
-from services import auth_service
+from flask import Response, abort, g, redirect, url_for, request, current_app
+from redis.exceptions import RedisError
+from sqlalchemy import and_, exists
+from models import db, Order, Listing
+from services import auth_service, cache_service
+
+# Most clients the in-memory rate limit fallback tracks per view
+RATE_LIMIT_MAX_CLIENTS = 10_000
+
+# Fixed error payloads, serialized once at import
+_ERROR_BODIES = {
+    message: orjson.dumps({'error': message})
+    for message in (
+        'Authentication required',
+        'Admin access required',
+        'Order ID required',
+        'Listing ID required',
+        'Access denied to this order',
+        'Only order creator can perform this action',
+        'Only listing owner can perform this action',
+        'Rate limit exceeded',
+        'Content-Type must be application/json',
+        'Invalid JSON',
+        'Internal server error',
+    )
+}
+
+def _json_error(message, status_code):
+    """Build a JSON error response, reusing the pre-serialized body when there is one"""
+    body = _ERROR_BODIES.get(message)
+    if body is None:
+        body = orjson.dumps({'error': message})
+    return Response(body, status=status_code, mimetype='application/json')
+
+def _current_user():
+    """Get the current user, looked up at most once per request"""
+    if 'current_user' not in g:
+        g.current_user = auth_service.get_current_user()
+    return g.current_user
+
+def _is_api():
+    """Whether the current request expects a JSON response"""
+    if '_is_api' not in g:
+        g._is_api = request.is_json or request.path.startswith('/api/')
+    return g._is_api
+
+def _deny(message, status_code, redirect_endpoint, **url_values):
+    """Reject the request: JSON error for API calls, redirect for pages"""
+    if _is_api():
+        return _json_error(message, status_code)
+    return redirect(url_for(redirect_endpoint, **url_values))
 
 def login_required(f):
     """Decorator that requires user to be authenticated
@@ -11,10 +65,7 @@ def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not auth_service.is_authenticated():
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Authentication required'}), 401
-            else:
-                return redirect(url_for('auth.login'))
+            return _deny('Authentication required', 401, 'auth.login')
         return f(*args, **kwargs)
     return decorated_function
 
@@ -26,17 +77,11 @@ def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not auth_service.is_authenticated():
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Authentication required'}), 401
-            else:
-                return redirect(url_for('auth.login'))
+            return _deny('Authentication required', 401, 'auth.login')
         
-        current_user = auth_service.get_current_user()
+        current_user = _current_user()
         if not current_user or not current_user.is_admin:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Admin access required'}), 403
-            else:
-                return redirect(url_for('views.index'))
+            return _deny('Admin access required', 403, 'views.index')
         
         return f(*args, **kwargs)
     return decorated_function
@@ -51,7 +96,7 @@ def profile_required(f):
         if not auth_service.is_authenticated():
             return redirect(url_for('auth.login'))
         
-        current_user = auth_service.get_current_user()
+        current_user = _current_user()
         if not current_user.profile_completed:
             return redirect(url_for('auth.setup_profile'))
         
@@ -66,36 +111,40 @@ def order_access_required(f):
     - Creator of the order
     - Participant (has listings) in the order
     - Admin
+    
+    The loaded order is stored on g.order and the participant flag on
+    g.is_participant for the view to reuse.
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not auth_service.is_authenticated():
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Authentication required'}), 401
-            else:
-                return redirect(url_for('auth.login'))
+            return _deny('Authentication required', 401, 'auth.login')
         
         order_id = kwargs.get('order_id')
         if not order_id:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Order ID required'}), 400
-            else:
-                return redirect(url_for('views.index'))
+            return _deny('Order ID required', 400, 'views.index')
+        
+        current_user = _current_user()
         
-        from models import Order, Listing
-        order = Order.query.get_or_404(order_id)
-        current_user = auth_service.get_current_user()
+        # Load the order and whether the user has listings in it in one query;
+        # both are kept on g so the view doesn't query the order again
+        row = db.session.execute(
+            db.select(
+                Order,
+                exists().where(and_(Listing.order_id == Order.id, Listing.user_id == current_user.id)).label('is_participant')
+            ).where(Order.id == order_id)
+        ).first()
+        if row is None:
+            abort(404)
+        g.order, g.is_participant = row
         
         # Check access: creator, participant, or admin
-        is_creator = order.creator_id == current_user.id
-        is_participant = Listing.query.filter_by(order_id=order_id, user_id=current_user.id).count() > 0
+        is_creator = g.order.creator_id == current_user.id
+        is_participant = g.is_participant
         is_admin = current_user.is_admin
         
         if not (is_creator or is_participant or is_admin):
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Access denied to this order'}), 403
-            else:
-                return redirect(url_for('views.index'))
+            return _deny('Access denied to this order', 403, 'views.index')
         
         return f(*args, **kwargs)
     return decorated_function
@@ -109,27 +158,19 @@ def order_creator_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not auth_service.is_authenticated():
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Authentication required'}), 401
-            else:
-                return redirect(url_for('auth.login'))
+            return _deny('Authentication required', 401, 'auth.login')
         
         order_id = kwargs.get('order_id')
         if not order_id:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Order ID required'}), 400
-            else:
-                return redirect(url_for('views.index'))
+            return _deny('Order ID required', 400, 'views.index')
         
-        from models import Order
-        order = Order.query.get_or_404(order_id)
-        current_user = auth_service.get_current_user()
+        creator_id = db.session.query(Order.creator_id).filter(Order.id == order_id).scalar()
+        if creator_id is None:
+            abort(404)
+        current_user = _current_user()
         
-        if order.creator_id != current_user.id and not current_user.is_admin:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Only order creator can perform this action'}), 403
-            else:
-                return redirect(url_for('views.view_order', order_id=order_id))
+        if creator_id != current_user.id and not current_user.is_admin:
+            return _deny('Only order creator can perform this action', 403, 'views.view_order', order_id=order_id)
         
         return f(*args, **kwargs)
     return decorated_function
@@ -143,67 +184,98 @@ def listing_owner_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not auth_service.is_authenticated():
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Authentication required'}), 401
-            else:
-                return redirect(url_for('auth.login'))
+            return _deny('Authentication required', 401, 'auth.login')
         
         listing_id = kwargs.get('listing_id')
         if not listing_id:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Listing ID required'}), 400
-            else:
-                return redirect(url_for('views.index'))
+            return _deny('Listing ID required', 400, 'views.index')
         
-        from models import Listing
-        listing = Listing.query.get_or_404(listing_id)
-        current_user = auth_service.get_current_user()
+        listing = db.session.query(Listing.user_id, Listing.order_id).filter(Listing.id == listing_id).first()
+        if listing is None:
+            abort(404)
+        current_user = _current_user()
         
         if listing.user_id != current_user.id and not current_user.is_admin:
-            if request.is_json or request.path.startswith('/api/'):
-                return jsonify({'error': 'Only listing owner can perform this action'}), 403
-            else:
-                return redirect(url_for('views.view_order', order_id=listing.order_id))
+            return _deny('Only listing owner can perform this action', 403, 'views.view_order', order_id=listing.order_id)
         
         return f(*args, **kwargs)
     return decorated_function
 
+def _rl_check(key, limit, window):
+    """Sliding-window counter check against Redis
+    
+    Counts requests in fixed buckets of `window` seconds and weights the
+    previous bucket by how much of it still overlaps the sliding window.
+    Returns True/False, or None if Redis can't answer.
+    """
+    if not cache_service.is_available():
+        return None
+    
+    now = time.time()
+    bucket = int(now // window)
+    current_key = f"{key}:{bucket}"
+    try:
+        pipe = cache_service.redis_client.pipeline(transaction=False)
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(f"{key}:{bucket - 1}")
+        current, _, previous = pipe.execute()
+    except RedisError as e:
+        current_app.logger.warning(f"Redis rate limit unavailable, using local window: {e}")
+        return None
+    
+    overlap = (window - (now % window)) / window
+    return int(previous or 0) * overlap + current <= limit
+
 def rate_limit(requests_per_minute=60):
-    """Decorator for basic rate limiting
+    """Decorator for rate limiting per client IP
     
-    This is a simple in-memory rate limiter.
-    For production, consider using Flask-Limiter or Redis-based limiting.
+    Uses a Redis sliding-window counter so the limit is shared by all
+    workers. Falls back to an in-memory window when Redis is unavailable.
     """
-    import time
-    from collections import defaultdict, deque
+    # In-memory fallback (per process, only used without Redis), kept as a
+    # bounded LRU so churning client IPs can't grow it without limit
+    request_times = OrderedDict()
+    request_times_lock = threading.Lock()
     
-    # In-memory storage (not suitable for multiple workers)
-    request_times = defaultdict(deque)
+    def _local_allows(client_id, now):
+        """In-memory sliding window for a single process"""
+        window_start = now - 60
+        with request_times_lock:
+            client_requests = request_times.get(client_id)
+            if client_requests is None:
+                client_requests = deque()
+                request_times[client_id] = client_requests
+                if len(request_times) > RATE_LIMIT_MAX_CLIENTS:
+                    request_times.popitem(last=False)
+            else:
+                request_times.move_to_end(client_id)
+            
+            while client_requests and client_requests[0] < window_start:
+                client_requests.popleft()
+            
+            if len(client_requests) >= requests_per_minute:
+                return False
+            
+            client_requests.append(now)
+            return True
     
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Get client identifier (IP address)
             client_id = request.environ.get('REMOTE_ADDR', 'unknown')
-            current_time = time.time()
             
-            # Clean old requests (older than 1 minute)
-            window_start = current_time - 60
-            client_requests = request_times[client_id]
+            allowed = _rl_check(f"rl:{client_id}:{f.__name__}", requests_per_minute, 60)
+            if allowed is None:
+                allowed = _local_allows(client_id, time.time())
             
-            while client_requests and client_requests[0] < window_start:
-                client_requests.popleft()
-            
-            # Check if limit exceeded
-            if len(client_requests) >= requests_per_minute:
-                if request.is_json or request.path.startswith('/api/'):
-                    return jsonify({'error': 'Rate limit exceeded'}), 429
+            if not allowed:
+                if _is_api():
+                    return _json_error('Rate limit exceeded', 429)
                 else:
                     return "Rate limit exceeded", 429
             
-            # Add current request
-            client_requests.append(current_time)
-            
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -214,29 +286,27 @@ def validate_json(required_fields=None):
     Args:
         required_fields (list): List of required field names
     """
-    if required_fields is None:
-        required_fields = []
+    # Freeze the field list once, at decoration time
+    fields = tuple(required_fields or ())
+    
+    def find_missing(data):
+        """Return the required fields that are absent or null"""
+        return [field for field in fields if field not in data or data[field] is None]
     
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not request.is_json:
-                return jsonify({'error': 'Content-Type must be application/json'}), 400
+                return _json_error('Content-Type must be application/json', 400)
             
             data = request.get_json(silent=True)
             if data is None:
-                return jsonify({'error': 'Invalid JSON'}), 400
+                return _json_error('Invalid JSON', 400)
             
             # Check required fields
-            missing_fields = []
-            for field in required_fields:
-                if field not in data or data[field] is None:
-                    missing_fields.append(field)
-            
+            missing_fields = find_missing(data) if fields else None
             if missing_fields:
-                return jsonify({
-                    'error': f'Missing required fields: {", ".join(missing_fields)}'
-                }), 400
+                return _json_error(f'Missing required fields: {", ".join(missing_fields)}', 400)
             
             return f(*args, **kwargs)
         return decorated_function
@@ -249,18 +319,18 @@ def handle_exceptions(f):
         try:
             return f(*args, **kwargs)
         except ValueError as e:
-            current_app.logger.warning(f"ValueError in {f.__name__}: {str(e)}")
-            return jsonify({'error': str(e)}), 400
+            current_app.logger.warning("ValueError in %s: %s", f.__name__, e)
+            return _json_error(str(e), 400)
         except Exception as e:
-            current_app.logger.error(f"Unexpected error in {f.__name__}: {str(e)}")
+            current_app.logger.error("Unexpected error in %s: %s", f.__name__, e, exc_info=True)
             if current_app.debug:
-                return jsonify({'error': str(e)}), 500
+                return _json_error(str(e), 500)
             else:
-                return jsonify({'error': 'Internal server error'}), 500
+                return _json_error('Internal server error', 500)
     return decorated_function
 
 def cache_response(timeout=300):
-    """Decorator to cache API responses
+    """Decorator to cache JSON API responses
     
     Args:
         timeout (int): Cache timeout in seconds
@@ -268,28 +338,43 @@ def cache_response(timeout=300):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            from services import cache_service
-            
-            if not cache_service.is_available():
+            # Redis is connected at startup; without it just run the view
+            redis_client = cache_service.redis_client
+            if redis_client is None:
                 return f(*args, **kwargs)
             
             # Generate cache key from route and arguments
-            cache_key = f"response:{f.__name__}:{hash(str(args) + str(kwargs))}"
+            key_src = repr((f.__name__, args, tuple(sorted(kwargs.items())))).encode()
+            cache_key = f"response:{hashlib.blake2b(key_src, digest_size=16).hexdigest()}"
             
-            # Try to get from cache
-            cached_response = cache_service.get(cache_key)
-            if cached_response:
-                return cached_response
+            # Serve cached bodies as-is, without decoding them again
+            try:
+                cached_body = redis_client.get(cache_key)
+            except RedisError as e:
+                current_app.logger.warning(f"Cache get error: {e}")
+                cached_body = None
+            if cached_body is not None:
+                return Response(cached_body, status=200, mimetype='application/json')
             
             # Execute function and cache result
             response = f(*args, **kwargs)
             
-            # Only cache successful responses
-            if hasattr(response, 'status_code') and response.status_code == 200:
-                cache_service.set(cache_key, response.get_data(as_text=True), timeout)
-            elif isinstance(response, (dict, list)):
-                cache_service.set(cache_key, response, timeout)
+            # Only cache successful JSON responses. Dicts and lists are encoded
+            # with Flask's own JSON provider, the same one that renders the
+            # response, so a hit is byte-identical to a miss.
+            try:
+                if isinstance(response, Response):
+                    body = response.get_data() if response.status_code == 200 and response.is_json else None
+                elif isinstance(response, (dict, list)):
+                    body = current_app.json.response(response).get_data()
+                else:
+                    body = None
+                
+                if body is not None:
+                    redis_client.setex(cache_key, timeout, body)
+            except Exception as e:
+                current_app.logger.warning(f"Cache set error: {e}")
             
             return response
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
@@ -1,10 +1,72 @@
 import re
-import pytz
 from datetime import datetime, timezone
-from flask import current_app
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from flask import current_app, g, has_request_context
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from models import db, Order, Listing
 
 # Paris timezone
-PARIS_TZ = pytz.timezone('Europe/Paris')
+PARIS_TZ = ZoneInfo('Europe/Paris')
+
+# Precompiled patterns
+_LISTING_ID_RE = re.compile(r"/sell/item/(\d+)")
+_DISCOGS_URL_RE = re.compile(r"discogs\.com/sell/item/\d+")
+_PAREN_RE = re.compile(r'\(([^)]+)\)')
+_FNAME_BAD_RE = re.compile(r'[<>:"/\\|?*]')
+_FNAME_WS_RE = re.compile(r'\s+')
+
+# Record grading: full-text fallbacks (checked in order) and CSS classes by code
+_CONDITION_CODES = (
+    ('near mint', 'NM'),
+    ('very good plus', 'VG+'),
+    ('very good', 'VG'),
+    ('good plus', 'G+'),
+    ('good', 'G'),
+    ('fair', 'F'),
+    ('poor', 'P'),
+)
+_CONDITION_CLASSES = {
+    'M': 'bg-green-100 text-green-800',
+    'NM': 'bg-emerald-100 text-emerald-800',
+    'NM or M-': 'bg-emerald-100 text-emerald-800',
+    'M-': 'bg-emerald-100 text-emerald-800',
+    'VG+': 'bg-yellow-100 text-yellow-800',
+    'VG': 'bg-orange-100 text-orange-800',
+    'G+': 'bg-red-100 text-red-800',
+    'G': 'bg-red-100 text-red-800',
+}
+_CONDITION_DEFAULT_CLASS = 'bg-gray-100 text-gray-800'
+
+# Currency display formats
+_FMT = {
+    'EUR': '{:.2f}€',
+    'USD': '${:.2f}',
+    'GBP': '£{:.2f}',
+}
+_ZERO_AMOUNT = '0€'
+
+# Order status labels and badge classes
+_STATUS_MAP = {
+    'building': {
+        'text': '⛏️ COLLECTE',
+        'class': 'bg-yellow-100 text-yellow-800'
+    },
+    'payment': {
+        'text': '💳 PAIEMENTS',
+        'class': 'bg-blue-100 text-blue-800'
+    },
+    'transport': {
+        'text': '🚚 TRANSPORT',
+        'class': 'bg-green-100 text-green-800'
+    },
+    'distribution': {
+        'text': '🎁 DISTRIBUTION',
+        'class': 'bg-purple-100 text-purple-800'
+    }
+}
+_STATUS_DEFAULT_CLASS = 'bg-gray-100 text-gray-800'
 
 def paris_now():
     """Get current time in Paris timezone"""
@@ -23,8 +85,8 @@ def format_date_french(date_obj):
     
     if isinstance(date_obj, str):
         try:
-            date_obj = datetime.fromisoformat(date_obj.replace('Z', '+00:00'))
-        except:
+            date_obj = datetime.fromisoformat(date_obj)
+        except ValueError:
             return date_obj
     
     # Convert to Paris time if it's a UTC datetime
@@ -40,8 +102,8 @@ def format_datetime_french(datetime_obj):
     
     if isinstance(datetime_obj, str):
         try:
-            datetime_obj = datetime.fromisoformat(datetime_obj.replace('Z', '+00:00'))
-        except:
+            datetime_obj = datetime.fromisoformat(datetime_obj)
+        except ValueError:
             return datetime_obj
     
     # Convert to Paris time if it's a UTC datetime
@@ -62,7 +124,7 @@ def extract_listing_id(url):
     if not url:
         return None
     
-    match = re.search(r"/sell/item/(\d+)", url)
+    match = _LISTING_ID_RE.search(url)
     return match.group(1) if match else None
 
 def validate_discogs_url(url):
@@ -82,7 +144,7 @@ def validate_discogs_url(url):
         return False
     
     # Check if it's a Discogs URL with listing ID
-    return bool(re.search(r"discogs\.com/sell/item/\d+", url))
+    return bool(_DISCOGS_URL_RE.search(url))
 
 def format_currency(amount, currency='EUR'):
     """Format currency amount
@@ -95,16 +157,12 @@ def format_currency(amount, currency='EUR'):
         str: Formatted currency string
     """
     if amount is None:
-        return "0€"
-    
-    if currency == 'EUR':
-        return f"{amount:.2f}€"
-    elif currency == 'USD':
-        return f"${amount:.2f}"
-    elif currency == 'GBP':
-        return f"£{amount:.2f}"
-    else:
+        return _ZERO_AMOUNT
+    
+    fmt = _FMT.get(currency)
+    if fmt is None:
         return f"{amount:.2f} {currency}"
+    return fmt.format(amount)
 
 def truncate_text(text, max_length=50, suffix="..."):
     """Truncate text to specified length
@@ -125,6 +183,7 @@ def truncate_text(text, max_length=50, suffix="..."):
     
     return text[:max_length - len(suffix)] + suffix
 
+@lru_cache(maxsize=64)
 def get_condition_class(condition):
     """Get CSS class for record condition
     
@@ -135,23 +194,11 @@ def get_condition_class(condition):
         str: CSS class name
     """
     if not condition:
-        return 'bg-gray-100 text-gray-800'
+        return _CONDITION_DEFAULT_CLASS
     
-    condition_lower = condition.lower()
-    
-    if 'mint' in condition_lower and 'near' not in condition_lower:
-        return 'bg-green-100 text-green-800'
-    elif 'near mint' in condition_lower:
-        return 'bg-emerald-100 text-emerald-800'
-    elif 'very good plus' in condition_lower:
-        return 'bg-yellow-100 text-yellow-800'
-    elif 'very good' in condition_lower:
-        return 'bg-orange-100 text-orange-800'
-    elif 'good' in condition_lower:
-        return 'bg-red-100 text-red-800'
-    else:
-        return 'bg-gray-100 text-gray-800'
+    return _CONDITION_CLASSES.get(get_short_condition(condition), _CONDITION_DEFAULT_CLASS)
 
+@lru_cache(maxsize=64)
 def get_short_condition(condition):
     """Get short form of condition
     
@@ -165,7 +212,7 @@ def get_short_condition(condition):
         return ''
     
     # Extract from parentheses first (e.g. "Very Good Plus (VG+)" => "VG+")
-    match = re.search(r'\(([^)]+)\)', condition)
+    match = _PAREN_RE.search(condition)
     if match:
         return match.group(1)
     
@@ -173,20 +220,9 @@ def get_short_condition(condition):
     condition_lower = condition.lower()
     if 'mint' in condition_lower and 'near' not in condition_lower:
         return 'M'
-    elif 'near mint' in condition_lower:
-        return 'NM'
-    elif 'very good plus' in condition_lower:
-        return 'VG+'
-    elif 'very good' in condition_lower:
-        return 'VG'
-    elif 'good plus' in condition_lower:
-        return 'G+'
-    elif 'good' in condition_lower:
-        return 'G'
-    elif 'fair' in condition_lower:
-        return 'F'
-    elif 'poor' in condition_lower:
-        return 'P'
+    for needle, code in _CONDITION_CODES:
+        if needle in condition_lower:
+            return code
     
     return condition[:3].upper()  # Fallback: first 3 chars
 
@@ -199,29 +235,10 @@ def get_status_info(status):
     Returns:
         dict: Status info with text and CSS class
     """
-    status_map = {
-        'building': {
-            'text': '⛏️ COLLECTE',
-            'class': 'bg-yellow-100 text-yellow-800'
-        },
-        'payment': {
-            'text': '💳 PAIEMENTS',
-            'class': 'bg-blue-100 text-blue-800'
-        },
-        'transport': {
-            'text': '🚚 TRANSPORT',
-            'class': 'bg-green-100 text-green-800'
-        },
-        'distribution': {
-            'text': '🎁 DISTRIBUTION',
-            'class': 'bg-purple-100 text-purple-800'
-        }
-    }
-    
-    return status_map.get(status, {
-        'text': status.upper(),
-        'class': 'bg-gray-100 text-gray-800'
-    })
+    info = _STATUS_MAP.get(status)
+    if info is not None:
+        return info
+    return {'text': status.upper(), 'class': _STATUS_DEFAULT_CLASS}
 
 def calculate_time_remaining(deadline):
     """Calculate time remaining until deadline
@@ -237,8 +254,8 @@ def calculate_time_remaining(deadline):
     
     if isinstance(deadline, str):
         try:
-            deadline = datetime.fromisoformat(deadline.replace('Z', '+00:00'))
-        except:
+            deadline = datetime.fromisoformat(deadline)
+        except ValueError:
             return ''
     
     now = datetime.now(timezone.utc)
@@ -270,12 +287,9 @@ def safe_float(value, default=0.0):
     Returns:
         float: Converted value or default
     """
-    if value is None:
-        return default
-    
     try:
         return float(value)
-    except (ValueError, TypeError):
+    except (TypeError, ValueError):
         return default
 
 def safe_int(value, default=0):
@@ -288,12 +302,9 @@ def safe_int(value, default=0):
     Returns:
         int: Converted value or default
     """
-    if value is None:
-        return default
-    
     try:
         return int(value)
-    except (ValueError, TypeError):
+    except (TypeError, ValueError):
         return default
 
 def sanitize_filename(filename):
@@ -309,28 +320,37 @@ def sanitize_filename(filename):
         return "unknown"
     
     # Remove/replace problematic characters
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-    filename = re.sub(r'\s+', '_', filename)  # Replace spaces with underscores
+    filename = _FNAME_BAD_RE.sub('_', filename)
+    filename = _FNAME_WS_RE.sub('_', filename)  # Replace spaces with underscores
     filename = filename.strip('.')  # Remove leading/trailing dots
     
     return filename[:100]  # Limit length
 
-def generate_order_summary_text(order):
+def generate_order_summary_text(order_id):
     """Generate text summary of an order for sharing/export
     
     Args:
-        order: Order object
+        order_id (int): Order ID
         
     Returns:
-        str: Text summary
+        str: Text summary, empty if the order does not exist
     """
+    # Reuse the order already loaded by order_access_required, if any
+    order = g.get('order') if has_request_context() else None
+    if order is None or order.id != order_id:
+        order = db.session.query(Order).options(selectinload(Order.creator)).filter_by(id=order_id).first()
+    if order is None:
+        return ""
+    
+    records_count = db.session.query(func.count(Listing.id)).filter_by(order_id=order.id, status='For Sale').scalar()
+    
     lines = [
         f"=== COMMANDE {order.seller_name.upper()} ===",
         f"Créateur: {order.creator.username}",
         f"Statut: {get_status_info(order.status)['text']}",
         f"Total: {format_currency(order.total_with_fees)}",
         f"Participants: {order.participants_count}",
-        f"Disques: {order.listings.filter_by(status='For Sale').count()}",
+        f"Disques: {records_count}",
         ""
     ]
     